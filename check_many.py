@@ -0,0 +1,70 @@
+# (C) Copyright Wieger Wesselink 2025. Distributed under the GPL-3.0-or-later
+# Software License, (See accompanying file LICENSE or copy at
+# https://www.gnu.org/licenses/gpl-3.0.txt)
+
+import argparse
+from pathlib import Path
+
+from check_submission import Settings, check_submission
+
+
+def read_pairs(pairs_file: str) -> list[tuple[str, str]]:
+    """
+    Reads the assignment and submission filenames from a pairs file.
+
+    Each non-empty line of the file contains an assignment filename and a submission filename,
+    separated by whitespace. Lines starting with '#' are ignored.
+
+    Args:
+        pairs_file (str): The filename of the pairs file.
+
+    Returns:
+        list[tuple[str, str]]: A list of (assignment, submission) filename pairs.
+
+    Raises:
+        ValueError: If a line does not contain exactly two filenames.
+    """
+    pairs = []
+    for line_num, line in enumerate(Path(pairs_file).read_text().splitlines(), start=1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if len(fields) != 2:
+            raise ValueError(f"Line {line_num} of {pairs_file} must contain an assignment and a submission filename.")
+        pairs.append((fields[0], fields[1]))
+    return pairs
+
+
+def main() -> None:
+    cmdline_parser = argparse.ArgumentParser(description='Check many submissions with TODO markers against their original assignments in one process.')
+    cmdline_parser.add_argument('pairs', metavar='FILENAME', type=str, help='a file with on each line an assignment .dfy file and a submitted .dfy file.')
+    cmdline_parser.add_argument('--no-filename-check', help=argparse.SUPPRESS, action='store_true')
+    args = cmdline_parser.parse_args()
+
+    if args.no_filename_check:
+        Settings.no_filename_check = True
+
+    if not Path(args.pairs).is_file():
+        print(f'ERROR: Pairs file {args.pairs} does not exist.')
+        return
+
+    try:
+        pairs = read_pairs(args.pairs)
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        return
+
+    for assignment, submission in pairs:
+        print(f'Comparing the assignment `{assignment}` with the submission `{submission}`')
+
+        if not Path(assignment).is_file():
+            print(f'ERROR: Assignment file {assignment} does not exist.')
+        elif not Path(submission).is_file():
+            print(f'ERROR: Submission file {submission} does not exist.')
+        else:
+            print(check_submission(assignment, submission))
+        print('')
+
+
+if __name__ == '__main__':
+    main()
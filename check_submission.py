@@ -9,19 +9,30 @@
 # - The comparison of the segments between TODO markers has been made less strict with regards to whitespace.
 
 import argparse
+import functools
 import re
+from collections.abc import Iterable, Mapping, Sequence
 from pathlib import Path
+from types import MappingProxyType
+from typing import ClassVar
+
+_TAG_RE = re.compile(r"//\s*(BEGIN|END)-TODO\((.*?)\)")
+ASSIGNMENT_SUFFIX = "-assignment.dfy"
+SUBMISSION_SUFFIX = "-submission.dfy"
+
 
 class Settings(object):
-    no_filename_check = False
+    no_filename_check: ClassVar[bool] = False
 
 
-def extract_tags(text: str) -> dict[str, tuple[int, int]]:
+def extract_tags(lines: Iterable[str]) -> dict[str, tuple[int, int]]:
     """
-    Extracts all unique tags from the text along with their line numbers.
+    Extracts all unique tags from the lines of a text along with their line numbers.
+
+    The lines are consumed in a single pass, so an open file object can be passed directly.
 
     Args:
-        text (str): The input text containing the markers.
+        lines (Iterable[str]): The lines of the input text containing the markers.
 
     Returns:
         dict[str, tuple[int, int]]: A dictionary where each key is a tag, and the value is a tuple
@@ -30,11 +41,16 @@ def extract_tags(text: str) -> dict[str, tuple[int, int]]:
     Raises:
         ValueError: If there are unmatched, duplicate, or overlapping tag pairs.
     """
-    tags = {}
-    tag_pattern = re.compile(r"//\s*(BEGIN|END)-TODO\((.*?)\)")
-
-    for line_num, line in enumerate(text.splitlines(), start=1):
-        match = tag_pattern.search(line)
+    tags: dict[str, tuple[int, int | None]] = {}
+    last_tag = ""
+    last_begin = 0
+    last_end = 0
+
+    for line_num, line in enumerate(lines, start=1):
+        # Cheap substring test to skip the regex on lines that cannot contain a marker
+        if "-TODO(" not in line:
+            continue
+        match = _TAG_RE.search(line)
         if match:
             marker_type, tag = match.groups()
             if marker_type == "BEGIN":
@@ -46,100 +62,97 @@ def extract_tags(text: str) -> dict[str, tuple[int, int]]:
                     raise ValueError(f"END-TODO tag '{tag}' at line {line_num} has no matching BEGIN-TODO.")
                 if tags[tag][1] is not None:
                     raise ValueError(f"Duplicate END-TODO tag '{tag}' found at line {line_num}.")
-                tags[tag] = (tags[tag][0], line_num)
+                begin_line = tags[tag][0]
+                # Tag pairs are closed in line order, so each pair must begin after the previous one ended
+                if begin_line < last_end:
+                    # Report the two pairs in the order in which they begin
+                    first, second = sorted([(last_begin, last_end, last_tag), (begin_line, line_num, tag)])
+                    raise ValueError(f"Overlapping tags detected: '{first[2]}' (lines {first[0]}-{first[1]}) and '{second[2]}' (lines {second[0]}-{second[1]}).")
+                tags[tag] = (begin_line, line_num)
+                last_tag = tag
+                last_begin = begin_line
+                last_end = line_num
 
     # Check for tags with missing END markers
+    closed_tags: dict[str, tuple[int, int]] = {}
     for tag, (begin_line, end_line) in tags.items():
         if end_line is None:
             raise ValueError(f"BEGIN-TODO tag '{tag}' at line {begin_line} has no matching END-TODO.")
+        closed_tags[tag] = (begin_line, end_line)
 
-    # Check for overlapping tag pairs
-    sorted_tags = sorted(tags.items(), key=lambda x: x[1])
-    for i in range(len(sorted_tags) - 1):
-        current_tag, (current_begin, current_end) = sorted_tags[i]
-        next_tag, (next_begin, next_end) = sorted_tags[i + 1]
-        if current_end > next_begin:
-            raise ValueError(f"Overlapping tags detected: '{current_tag}' (lines {current_begin}-{current_end}) and '{next_tag}' (lines {next_begin}-{next_end}).")
+    return closed_tags
 
-    return tags
 
-
-def compare_tags(assignment_tags: dict[str, tuple[int, int]], submission_tags: dict[str, tuple[int, int]]) -> None:
+def compare_tags(assignment_tags: Mapping[str, tuple[int, int]], submission_tags: Mapping[str, tuple[int, int]]) -> None:
     """
     Compares the tags from the assignemnt and the submission to check if they match.
 
     Args:
-        assignment_tags (dict[str, tuple[int, int]]): The tags extracted from the assignment text.
-        submission_tags (dict[str, tuple[int, int]]): The tags extracted from the submission text.
+        assignment_tags (Mapping[str, tuple[int, int]]): The tags extracted from the assignment text.
+        submission_tags (Mapping[str, tuple[int, int]]): The tags extracted from the submission text.
 
     Raises:
         ValueError: If the tags do not match, with specific details about the mismatch.
     """
-    assignment_tag_order = list(assignment_tags.keys())
-    submission_tag_order = list(submission_tags.keys())
-
     # Check for missing tags
-    missing_tags = [tag for tag in assignment_tag_order if tag not in submission_tag_order]
+    missing_tags = [tag for tag in assignment_tags if tag not in submission_tags]
     if missing_tags:
         raise ValueError(f"The following tags are missing in the submission: {', '.join(missing_tags)}")
 
     # Check for extra tags
-    extra_tags = [tag for tag in submission_tag_order if tag not in assignment_tag_order]
+    extra_tags = [tag for tag in submission_tags if tag not in assignment_tags]
     if extra_tags:
         raise ValueError(f"The following extra tags are present in the submission: {', '.join(extra_tags)}")
 
     # Check for order mismatch
-    for i, (expected_tag, actual_tag) in enumerate(zip(assignment_tag_order, submission_tag_order)):
+    for i, (expected_tag, actual_tag) in enumerate(zip(assignment_tags, submission_tags)):
         if expected_tag != actual_tag:
             raise ValueError(
                 f"Tag mismatch at position {i + 1}: expected '{expected_tag}' but found '{actual_tag}'."
             )
 
 
-def extract_original_segments(text: str, tags: dict[str, tuple[int, int]]) -> list[str]:
+def extract_original_segments(lines: list[str], tags: dict[str, tuple[int, int]]) -> list[str]:
     """
     Extracts segments of text outside the TODO markers.
 
     Args:
-        text (str): The input text containing the markers.
+        lines (list[str]): The lines of the input text containing the markers, including their line endings.
         tags (dict[str, tuple[int, int]]): Extracted tags with their line numbers.
 
     Returns:
         list[str]: A list of text segments outside the TODO markers.
     """
-    lines = text.splitlines()
-    segments = []
+    segments: list[str] = []
     prev_end = 0
 
     sorted_tags = sorted(tags.values())
 
     for begin, end in sorted_tags:
         if prev_end < begin - 1:
-            segments.append("\n".join(lines[prev_end:begin - 1]))
+            segments.append("".join(lines[prev_end:begin - 1]))
         prev_end = end
 
     if prev_end < len(lines):
-        segments.append("\n".join(lines[prev_end:]))
+        segments.append("".join(lines[prev_end:]))
 
     return segments
 
 
-def insert_submission_tags(assignment_text: str, submission_text: str, assignment_tags: dict[str, tuple[int, int]], submission_tags: dict[str, tuple[int, int]]) -> str:
+def insert_submission_tags(assignment_lines: list[str], submission_lines: list[str], assignment_tags: dict[str, tuple[int, int]], submission_tags: dict[str, tuple[int, int]]) -> str:
     """
     Replaces the text between TODO markers in the assignment text with the text from the submitted text.
 
     Args:
-        assignment_text (str): The original assignment text.
-        submission_text (str): The submitted text.
+        assignment_lines (list[str]): The lines of the original assignment text, including their line endings.
+        submission_lines (list[str]): The lines of the submitted text, including their line endings.
         assignment_tags (dict[str, tuple[int, int]]): The tags from the original assignment with line numbers.
         submission_tags (dict[str, tuple[int, int]]): The tags from the submitted text with line numbers.
 
     Returns:
         str: The assignment text with the submitted answers inserted between the TODO markers.
     """
-    assignment_lines = assignment_text.splitlines()
-    submission_lines = submission_text.splitlines()
-    result_lines = []
+    result_lines: list[str] = []
     prev_end = 0
 
     for tag in assignment_tags:
@@ -150,13 +163,13 @@ def insert_submission_tags(assignment_text: str, submission_text: str, assignmen
         submission_begin, submission_end = submission_tags[tag]
 
         # Add text before the TODO block
-        result_lines.extend(assignment_lines[prev_end:assignment_begin])
+        result_lines.extend(assignment_lines[prev_end:assignment_begin - 1])
 
         # Add the BEGIN-TODO marker
-        result_lines.append(assignment_lines[assignment_begin])
+        result_lines.append(assignment_lines[assignment_begin - 1])
 
         # Add the student's submission
-        result_lines.extend(submission_lines[submission_begin + 1:submission_end - 1])
+        result_lines.extend(submission_lines[submission_begin:submission_end - 1])
 
         # Add the END-TODO marker
         result_lines.append(assignment_lines[assignment_end - 1])
@@ -166,24 +179,48 @@ def insert_submission_tags(assignment_text: str, submission_text: str, assignmen
     # Add any remaining text after the last TODO block
     result_lines.extend(assignment_lines[prev_end:])
 
-    return "\n".join(result_lines)
+    return "".join(result_lines)
+
+
+def remove_whitespace(text: str) -> str:
+    """
+    Removes all whitespace from the text.
+
+    Args:
+        text (str): The input text.
+
+    Returns:
+        str: The text with all whitespace characters removed.
+    """
+    return "".join(text.split())
 
 
-def compare_segments(assignment_segments: list[str], submission_segments: list[str]) -> None:
+def compare_segments(assignment_segments: Sequence[str], submission_segments: Sequence[str], normalized_assignment_segments: tuple[str, ...] | None = None) -> None:
     """
     Compares segments of the original assignment with those in the submission.
 
     Args:
-        assignment_segments (list[str]): List of text segments from the original assignment.
-        submission_segments (list[str]): List of text segments from the submitted text.
+        assignment_segments (Sequence[str]): The text segments from the original assignment.
+        submission_segments (Sequence[str]): The text segments from the submitted text.
+        normalized_assignment_segments (tuple[str, ...] | None): The assignment segments with whitespace
+                                                                 removed, if they have been computed already.
 
     Raises:
         ValueError: If any segment from the original assignment has been modified in the submitted text,
                     ignoring whitespace differences.
     """
-    for assignment_segment, submission_segment in zip(assignment_segments, submission_segments):
-        if re.sub(r"\s+", "", assignment_segment) != re.sub(r"\s+", "", submission_segment):
-            raise ValueError(f"The original text has been modified:\n{assignment_segment}\n-------------------\n{submission_segment}")
+    if normalized_assignment_segments is None:
+        normalized_assignment_segments = tuple(remove_whitespace(segment) for segment in assignment_segments)
+
+    for assignment_segment, normalized_assignment_segment, submission_segment in zip(assignment_segments, normalized_assignment_segments, submission_segments):
+        # Most submissions leave the original text untouched
+        if assignment_segment == submission_segment:
+            continue
+        if normalized_assignment_segment != remove_whitespace(submission_segment):
+            # The segments keep their line endings, which should not end up in the feedback
+            assignment_text = "\n".join(assignment_segment.splitlines())
+            submission_text = "\n".join(submission_segment.splitlines())
+            raise ValueError(f"The original text has been modified:\n{assignment_text}\n-------------------\n{submission_text}")
 
 
 def check_filenames(assignment_file: str, submission_file: str) -> None:
@@ -210,10 +247,10 @@ def check_filenames(assignment_file: str, submission_file: str) -> None:
         check_filenames('homework1-assignment.dfy', 'homework1-submission.dfy')  # Passes validation
         check_filenames('homework1.txt', 'homework1-submission.dfy')             # Raises ValueError
     """
-    if not assignment_file.endswith("-assignment.dfy"):
-        raise ValueError("The assignment file must end with '-assignment.dfy'.")
+    if not assignment_file.endswith(ASSIGNMENT_SUFFIX):
+        raise ValueError(f"The assignment file must end with '{ASSIGNMENT_SUFFIX}'.")
 
-    expected_submission_file = re.sub(r"-assignment.dfy$", "-submission.dfy", assignment_file)
+    expected_submission_file = assignment_file[:-len(ASSIGNMENT_SUFFIX)] + SUBMISSION_SUFFIX
     if submission_file != expected_submission_file:
         if Settings.no_filename_check:
             print(f"WARNING: The submission file must be named '{expected_submission_file}'.")
@@ -221,6 +258,34 @@ def check_filenames(assignment_file: str, submission_file: str) -> None:
             raise ValueError(f"The submission file must be named '{expected_submission_file}'.")
 
 
+@functools.lru_cache(maxsize=32)
+def _assignment_profile(assignment_file: str, mtime_ns: int, size: int) -> tuple[Mapping[str, tuple[int, int]], tuple[str, ...], tuple[str, ...]]:
+    """
+    Parses an assignment file once, so that it can be checked against many submissions.
+
+    The modification time and size of the file are part of the cache key, such that an
+    assignment file that has been changed on disk is parsed again. The same profile is shared
+    by all submissions that are checked against the assignment, so it is returned read-only.
+
+    Args:
+        assignment_file (str): The filename of the assignment.
+        mtime_ns (int): The modification time of the assignment file in nanoseconds.
+        size (int): The size of the assignment file in bytes.
+
+    Returns:
+        tuple[Mapping[str, tuple[int, int]], tuple[str, ...], tuple[str, ...]]: The tags of the assignment,
+            its original segments, and the original segments with whitespace removed.
+
+    Raises:
+        ValueError: If the tags of the assignment are invalid.
+    """
+    assignment_lines = Path(assignment_file).read_text().splitlines(keepends=True)
+    assignment_tags = extract_tags(assignment_lines)
+    assignment_segments = tuple(extract_original_segments(assignment_lines, assignment_tags))
+    normalized_segments = tuple(remove_whitespace(segment) for segment in assignment_segments)
+    return MappingProxyType(assignment_tags), assignment_segments, normalized_segments
+
+
 def check_submission(assignment_file: str, submission_file: str) -> str:
     """
     Validates a student's submission against the original assignment.
@@ -238,12 +303,12 @@ def check_submission(assignment_file: str, submission_file: str) -> str:
     except ValueError as e:
         return f'The submission is REJECTED.\n{e}'
 
-    assignment_text = Path(assignment_file).read_text()
-    submission_text = Path(submission_file).read_text()
+    assignment_stat = Path(assignment_file).stat()
+    submission_lines = Path(submission_file).read_text().splitlines(keepends=True)
 
     try:
-        assignment_tags = extract_tags(assignment_text)
-        submission_tags = extract_tags(submission_text)
+        assignment_tags, assignment_segments, normalized_assignment_segments = _assignment_profile(assignment_file, assignment_stat.st_mtime_ns, assignment_stat.st_size)
+        submission_tags = extract_tags(submission_lines)
     except ValueError as e:
         return f'The submission is REJECTED.\n{e}'
 
@@ -252,18 +317,17 @@ def check_submission(assignment_file: str, submission_file: str) -> str:
     except ValueError as e:
         return f'The submission is REJECTED.\n{e}'
 
-    assignment_segments = extract_original_segments(assignment_text, assignment_tags)
-    submission_segments = extract_original_segments(submission_text, submission_tags)
+    submission_segments = extract_original_segments(submission_lines, submission_tags)
 
     try:
-        compare_segments(assignment_segments, submission_segments)
+        compare_segments(assignment_segments, submission_segments, normalized_assignment_segments)
     except ValueError as e:
         return f'The submission is REJECTED.\n{e}'
 
     return 'The submission is ACCEPTED.'
 
 
-def main():
+def main() -> None:
     cmdline_parser = argparse.ArgumentParser(description='Check a submission with TODO markers against the original assignment.')
     cmdline_parser.add_argument('assignment', metavar='FILENAME', type=str, help='a .dfy file containing the assignment.')
     cmdline_parser.add_argument('submission', metavar='FILENAME', type=str, help='a .dfy file containing the submitted answer.')